@@ -20,20 +20,20 @@ try:
     from templatecache import TemplateCache
     from baseproperties import BaseProperties
     from utils.geoiputils import GeoIP, get_geoip
-    from utils.utils import get_fields, matches_rule
+    from utils.utils import get_fields, normalize_rule, compile_rule, matches_rule
     from utils.cons import DATASETS_DIRECTORY_PATH
     from utils.iputils import is_ip_malicious, is_ip_tor
     from utils.requestutils import (
-        get_url, get_domain, get_subdomain, get_json_data, is_user_agent_malicious,
+        get_url, get_domain_and_subdomain, get_json_data, is_user_agent_malicious,
         get_http_version, update_url
     )
 except ImportError:
     from src.BotBlocker.utils.geoiputils import GeoIP, get_geoip
-    from src.BotBlocker.utils.utils import get_fields, matches_rule
+    from src.BotBlocker.utils.utils import get_fields, normalize_rule, compile_rule, matches_rule
     from src.BotBlocker.utils.cons import DATASETS_DIRECTORY_PATH
     from src.BotBlocker.utils.iputils import is_ip_malicious, is_ip_tor
     from src.BotBlocker.utils.requestutils import (
-        get_url, get_domain, get_subdomain, get_json_data, is_user_agent_malicious,
+        get_url, get_domain_and_subdomain, get_json_data, is_user_agent_malicious,
         get_http_version, update_url
     )
     from src.BotBlocker.templatecache import TemplateCache
@@ -152,7 +152,11 @@ class BotBlocker(BaseProperties):
 
         if not isinstance(rules, dict):
             rules = {}
-        self.rules = rules
+        # Kept as pairs: equivalent rules compile to the same cached Rule object,
+        # so as dict keys they would overwrite each other's changes
+        self.rules = [
+            (compile_rule(normalize_rule(rule)), changes) for rule, changes in rules.items()
+        ]
 
         self.template_cache = TemplateCache()
 
@@ -166,12 +170,12 @@ class BotBlocker(BaseProperties):
 
         if getattr(self, "initialized", None) is not True:
             self.default_settings = DEFAULT_SETTINGS
-            self.rules = {}
+            self.rules = []
 
             self.initialized = True
 
         required_datasets = [self.default_settings["dataset"]]
-        for changes in self.rules.values():
+        for _, changes in self.rules:
             dataset = changes.get("dataset", None)
             if dataset is not None:
                 required_datasets.append(dataset)
@@ -200,11 +204,11 @@ class BotBlocker(BaseProperties):
             return base_settings
 
         fields = []
-        for rule in self.rules:
+        for rule, _ in self.rules:
             fields.extend(get_fields(rule))
 
         field_data = self.get_field_data(fields)
-        for rule, changes in self.rules.items():
+        for rule, changes in self.rules:
             if not matches_rule(rule, field_data):
                 continue
 
@@ -231,10 +235,11 @@ class BotBlocker(BaseProperties):
         ip = self.ip_address
 
         splitted_url = urlparse(url)
+        domain, subdomain = get_domain_and_subdomain(url)
         basic_information = {
             "host": request.host, "netloc": splitted_url.netloc,
-            "hostname": splitted_url.hostname, "domain": get_domain(url),
-            "subdomain": get_subdomain(url), "path": splitted_url.path,
+            "hostname": splitted_url.hostname, "domain": domain,
+            "subdomain": subdomain, "path": splitted_url.path,
             "endpoint": request.endpoint, "scheme": splitted_url.scheme,
             "args": dict(request.args), "is_json": request.is_json,
             "json": get_json_data(request, {}), "url": url,
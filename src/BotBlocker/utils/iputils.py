@@ -9,24 +9,35 @@ Author:   tn3w (mail@tn3w.dev)
 License:  Apache-2.0 license
 """
 
-import re
-import random
 import socket
+import secrets
+import ipaddress
 import urllib.error
 import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from urllib.parse import urlencode
-from typing import Final, Optional
+from typing import Final, Optional, Union, Tuple, List, Dict, Callable
 from datetime import datetime, timedelta
 
 try:
-    from src.BotBlocker.utils.utils import Logger, http_request, cache_with_ttl, handle_exception
+    from src.BotBlocker.utils.utils import (
+        Logger, TTLCache, CACHE_MISS, REQUEST_HEADERS, http_request, cache_with_ttl,
+        handle_exception, is_float
+    )
     from src.BotBlocker.utils.geoiputils import GeoIP, get_geoip
 except ImportError:
     try:
-        from utils.utils import Logger, http_request, cache_with_ttl, handle_exception
+        from utils.utils import (
+            Logger, TTLCache, CACHE_MISS, REQUEST_HEADERS, http_request, cache_with_ttl,
+            handle_exception, is_float
+        )
         from utils.geoiputils import GeoIP, get_geoip
     except ImportError:
-        from utils import Logger, http_request, cache_with_ttl, handle_exception
+        from utils import (
+            Logger, TTLCache, CACHE_MISS, REQUEST_HEADERS, http_request, cache_with_ttl,
+            handle_exception, is_float
+        )
         from utils.geoiputils import GeoIP, get_geoip
 
 
@@ -52,9 +63,9 @@ UNWANTED_IPV4_RANGES: Final[list] = [
 UNWANTED_IPV6_RANGES: Final[list] = [
     ('::', '::'),
     ('::1', '::1'),
-    ('::ffff:0:0', '::ffff:0:ffff:ffff'),
+    ('::ffff:0:0', '::ffff:ffff:ffff'),
     ('64:ff9b::', '64:ff9b::ffff:ffff'),
-    ('64:ff9b:1::', '64:ff9b:1:ffff:ffff:ffff:ffff'),
+    ('64:ff9b:1::', '64:ff9b:1:ffff:ffff:ffff:ffff:ffff'),
     ('100::', '100::ffff:ffff:ffff:ffff'),
     ('2001::', '2001:0:ffff:ffff:ffff:ffff:ffff:ffff'),
     ('2001:20::', '2001:2f:ffff:ffff:ffff:ffff:ffff:ffff'),
@@ -65,25 +76,6 @@ UNWANTED_IPV6_RANGES: Final[list] = [
     ('fe80::', 'fe80::ffff:ffff:ffff:ffff'),
     ('ff00::', 'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff')
 ]
-IPV4_PATTERN: Final[str] = r'^(\d{1,3}\.){3}\d{1,3}$'
-IPV6_PATTERN: Final[str] = r"""
-    ^(
-        ([0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4} |
-        ([0-9a-fA-F]{1,4}:){1,7}: |
-        :(:[0-9a-fA-F]{1,4}){1,7} |
-        ([0-9a-fA-F]{1,4}:){1,6}:[0-9a-fA-F]{1,4} |
-        ([0-9a-fA-F]{1,4}:){1,5}(:[0-9a-fA-F]{1,4}){1,2} |
-        ([0-9a-fA-F]{1,4}:){1,4}(:[0-9a-fA-F]{1,4}){1,3} |
-        ([0-9a-fA-F]{1,4}:){1,3}(:[0-9a-fA-F]{1,4}){1,4} |
-        ([0-9a-fA-F]{1,4}:){1,2}(:[0-9a-fA-F]{1,4}){1,5} |
-        [0-9a-fA-F]{1,4}:((:[0-9a-fA-F]{1,4}){1,6}) |
-        :((:[0-9a-fA-F]{1,4}){1,7}|:) |
-        ([0-9a-fA-F]{1,4}:){1,7}:
-    )$
-"""
-
-COMPILED_IPV4_REGEX: Final[re.Pattern] = re.compile(IPV4_PATTERN, re.VERBOSE | re.IGNORECASE)
-COMPILED_IPV6_REGEX: Final[re.Pattern] = re.compile(IPV6_PATTERN, re.VERBOSE | re.IGNORECASE)
 
 
 def is_ipv4(ip_address: str) -> bool:
@@ -100,7 +92,12 @@ def is_ipv4(ip_address: str) -> bool:
     if not isinstance(ip_address, str):
         return False
 
-    return bool(COMPILED_IPV4_REGEX.match(ip_address))
+    try:
+        socket.inet_pton(socket.AF_INET, ip_address)
+    except (OSError, ValueError):
+        return False
+
+    return True
 
 
 def is_ipv6(ip_address: str) -> bool:
@@ -117,7 +114,12 @@ def is_ipv6(ip_address: str) -> bool:
     if not isinstance(ip_address, str):
         return False
 
-    return bool(COMPILED_IPV6_REGEX.match(ip_address))
+    try:
+        socket.inet_pton(socket.AF_INET6, ip_address)
+    except (OSError, ValueError):
+        return False
+
+    return True
 
 
 def explode_ipv6(ipv6_address: str) -> str:
@@ -184,14 +186,139 @@ def ipv6_to_int(ipv6_address: str) -> int:
         int: The integer representation of the IPv6 address.
     """
 
-    parts = ipv6_address.split(':')
-    parts = [int(part, 16) if part else 0 for part in parts]
+    return int.from_bytes(socket.inet_pton(socket.AF_INET6, ipv6_address), "big")
+
+
+def merge_ip_ranges(ip_ranges: list) -> List[Tuple[int, int]]:
+    """
+    Sorts and merges overlapping or adjacent integer IP ranges.
+
+    Args:
+        ip_ranges (list): A list of (start, end) tuples of integer IP addresses.
+
+    Returns:
+        List[Tuple[int, int]]: The sorted list of merged (start, end) tuples.
+    """
+
+    merged_ranges = []
+    for start_ip, end_ip in sorted(ip_ranges):
+        if merged_ranges and start_ip <= merged_ranges[-1][1] + 1:
+            if end_ip > merged_ranges[-1][1]:
+                merged_ranges[-1] = (merged_ranges[-1][0], end_ip)
+
+            continue
+
+        merged_ranges.append((start_ip, end_ip))
+
+    return merged_ranges
+
+
+BLOCK_UNCOVERED: Final[int] = 0
+BLOCK_COVERED: Final[int] = 1
+BLOCK_PARTIAL: Final[int] = 2
+
+
+def mark_ip_blocks(table: Union[bytearray, defaultdict], start_ip: int,
+                   end_ip: int, block_bits: int) -> None:
+    """
+    Marks every block of 2^block_bits addresses touched by an IP range as
+    fully or partially covered.
+
+    Args:
+        table (Union[bytearray, defaultdict]): The block table indexed by the block number.
+        start_ip (int): The first integer IP address of the range.
+        end_ip (int): The last integer IP address of the range.
+        block_bits (int): The number of host bits per block.
+    """
+
+    for block in range(start_ip >> block_bits, (end_ip >> block_bits) + 1):
+        block_start = block << block_bits
+        block_end = block_start + (1 << block_bits) - 1
+
+        if start_ip <= block_start and block_end <= end_ip:
+            table[block] = BLOCK_COVERED
+        elif table[block] != BLOCK_COVERED:
+            table[block] = BLOCK_PARTIAL
+
+
+def build_ipv4_block_tables(ip_ranges: list) -> Tuple[bytes, bytes, Dict[int, int]]:
+    """
+    Builds cascading /8, /16 and /24 lookup tables for a list of IPv4 ranges.
+
+    Args:
+        ip_ranges (list): A list of (start, end) tuples of IPv4 address strings.
+
+    Returns:
+        Tuple[bytes, bytes, Dict[int, int]]: The /8 table with 256 entries, the
+            /16 table with 65536 entries and the /24 entries below partial /16 blocks.
+    """
+
+    merged_ranges = merge_ip_ranges(
+        [(ipv4_to_int(start_ip), ipv4_to_int(end_ip)) for start_ip, end_ip in ip_ranges]
+    )
+
+    slash8_table, slash16_table, slash24_table = bytearray(256), bytearray(65536), defaultdict(int)
+
+    for start_ip, end_ip in merged_ranges:
+        mark_ip_blocks(slash8_table, start_ip, end_ip, 24)
+
+    for parent_table, child_table, parent_bits, child_bits in (
+        (slash8_table, slash16_table, 24, 16), (slash16_table, slash24_table, 16, 8)):
+
+        for start_ip, end_ip in merged_ranges:
+            for block in range(start_ip >> parent_bits, (end_ip >> parent_bits) + 1):
+                if parent_table[block] != BLOCK_PARTIAL:
+                    continue
+
+                block_start = block << parent_bits
+                block_end = block_start + (1 << parent_bits) - 1
+
+                mark_ip_blocks(
+                    child_table, max(start_ip, block_start),
+                    min(end_ip, block_end), child_bits
+                )
+
+    return bytes(slash8_table), bytes(slash16_table), dict(slash24_table)
+
+
+UNWANTED_IPV4_SLASH8_TABLE, UNWANTED_IPV4_SLASH16_TABLE, UNWANTED_IPV4_SLASH24_TABLE =\
+    build_ipv4_block_tables(UNWANTED_IPV4_RANGES)
+UNWANTED_IPV4_INT_RANGES: Final[List[Tuple[int, int]]] = merge_ip_ranges(
+    [(ipv4_to_int(start_ip), ipv4_to_int(end_ip)) for start_ip, end_ip in UNWANTED_IPV4_RANGES]
+)
+
+
+def is_unwanted_ipv4_int(ipv4_address_int: int) -> bool:
+    """
+    Checks whether the given integer IPv4 address is unwanted.
+
+    Args:
+        ipv4_address_int (int): The integer representation of the IPv4 address.
 
-    ip_int = 0
-    for i, part in enumerate(parts):
-        ip_int += part << (16 * (7 - i))
+    Returns:
+        bool: True if the IPv4 address is unwanted, False otherwise.
+    """
+
+    block_state = UNWANTED_IPV4_SLASH8_TABLE[ipv4_address_int >> 24]
+    if block_state != BLOCK_PARTIAL:
+        return block_state == BLOCK_COVERED
+
+    block_state = UNWANTED_IPV4_SLASH16_TABLE[ipv4_address_int >> 16]
+    if block_state != BLOCK_PARTIAL:
+        return block_state == BLOCK_COVERED
 
-    return ip_int
+    block_state = UNWANTED_IPV4_SLASH24_TABLE.get(ipv4_address_int >> 8, BLOCK_UNCOVERED)
+    if block_state != BLOCK_PARTIAL:
+        return block_state == BLOCK_COVERED
+
+    for start_ip, end_ip in UNWANTED_IPV4_INT_RANGES:
+        if ipv4_address_int < start_ip:
+            return False
+
+        if ipv4_address_int <= end_ip:
+            return True
+
+    return False
 
 
 def is_unwanted_ipv4(ipv4_address: Optional[str] = None) -> bool:
@@ -205,19 +332,96 @@ def is_unwanted_ipv4(ipv4_address: Optional[str] = None) -> bool:
         bool: True if the IPv4 address is unwanted, False otherwise.
     """
 
-    if not isinstance(ipv4_address, str):
+    # The lookup tables are indexed by the address, so it has to be in range
+    if not is_ipv4(ipv4_address):
         return False
 
-    ipv4_address_int = ipv4_to_int(ipv4_address)
+    return is_unwanted_ipv4_int(ipv4_to_int(ipv4_address))
 
-    for start_ip, end_ip in UNWANTED_IPV4_RANGES:
-        start_ipv4_int = ipv4_to_int(start_ip)
-        end_ipv4_int = ipv4_to_int(end_ip)
 
-        if start_ipv4_int <= ipv4_address_int <= end_ipv4_int:
-            return True
+class IPNetworkSet:
+    """
+    A set of IP networks that answers membership queries for integer IP
+    addresses with one hash lookup per distinct prefix length, probing the
+    shortest prefixes (the largest networks) first.
+    """
 
-    return False
+
+    def __init__(self, version: int = 6) -> None:
+        self.address_class = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+        self.max_prefix_length = 32 if version == 4 else 128
+
+        self.networks: Dict[int, set] = {}
+
+
+    def add(self, network: str) -> None:
+        """
+        Adds a network in CIDR notation, e.g. "fc00::/7".
+
+        Args:
+            network (str): The network to add.
+        """
+
+        ip_network = ipaddress.ip_network(network, strict = False)
+        host_bits = self.max_prefix_length - ip_network.prefixlen
+
+        if host_bits not in self.networks:
+            self.networks[host_bits] = set()
+            self.networks = dict(sorted(self.networks.items(), reverse = True))
+
+        self.networks[host_bits].add(int(ip_network.network_address) >> host_bits)
+
+
+    def add_range(self, start_ip: str, end_ip: str) -> None:
+        """
+        Adds every address between two IP addresses, inclusively.
+
+        Args:
+            start_ip (str): The first IP address of the range.
+            end_ip (str): The last IP address of the range.
+        """
+
+        for ip_network in ipaddress.summarize_address_range(
+            self.address_class(start_ip), self.address_class(end_ip)):
+
+            self.add(str(ip_network))
+
+
+    def __contains__(self, ip_address_int: int) -> bool:
+        """
+        Checks whether an integer IP address lies in one of the networks.
+
+        Args:
+            ip_address_int (int): The integer representation of the IP address.
+
+        Returns:
+            bool: True if the IP address is in the set, False otherwise.
+        """
+
+        for host_bits, network_prefixes in self.networks.items():
+            if ip_address_int >> host_bits in network_prefixes:
+                return True
+
+        return False
+
+
+UNWANTED_IPV6_NETWORKS: Final[IPNetworkSet] = IPNetworkSet(6)
+for unwanted_start_ipv6, unwanted_end_ipv6 in UNWANTED_IPV6_RANGES:
+    UNWANTED_IPV6_NETWORKS.add_range(unwanted_start_ipv6, unwanted_end_ipv6)
+
+
+def is_unwanted_ipv6_int(ipv6_address_int: int) -> bool:
+    """
+    Checks whether the given integer IPv6 address is unwanted.
+
+    Args:
+        ipv6_address_int (int): The integer representation of the IPv6 address.
+
+    Returns:
+        bool: True if the IPv6 address is unwanted, False otherwise.
+    """
+
+    return ipv6_address_int in UNWANTED_IPV6_NETWORKS
 
 
 def is_unwanted_ipv6(ipv6_address: Optional[str] = None) -> bool:
@@ -234,16 +438,7 @@ def is_unwanted_ipv6(ipv6_address: Optional[str] = None) -> bool:
     if not isinstance(ipv6_address, str):
         return False
 
-    ipv6_address_int = ipv6_to_int(ipv6_address)
-
-    for start_ipv6, end_ipv6 in UNWANTED_IPV6_RANGES:
-        start_ipv6_int = ipv6_to_int(start_ipv6)
-        end_ipv6_int = ipv6_to_int(end_ipv6)
-
-        if start_ipv6_int <= ipv6_address_int <= end_ipv6_int:
-            return True
-
-    return False
+    return is_unwanted_ipv6_int(ipv6_to_int(ipv6_address))
 
 
 def is_valid_ip(ip_address: Optional[str] = None,
@@ -262,42 +457,37 @@ def is_valid_ip(ip_address: Optional[str] = None,
     if not isinstance(ip_address, str):
         return False
 
-    if not without_filter:
-        is_ipv4_address = is_ipv4(ip_address)
-        is_ipv6_address = is_ipv6(ip_address)
-
-        if not is_ipv4_address and not is_ipv6_address:
-            return False
-
-        if (is_ipv4_address and is_unwanted_ipv4(ip_address)) or\
-            (is_ipv6_address and is_unwanted_ipv6(ip_address)):
-
+    try:
+        ip_address_int = int.from_bytes(socket.inet_pton(socket.AF_INET, ip_address), "big")
+        is_unwanted_ip_int = is_unwanted_ipv4_int
+    except (OSError, ValueError):
+        try:
+            ip_address_int = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip_address), "big")
+            is_unwanted_ip_int = is_unwanted_ipv6_int
+        except (OSError, ValueError):
             return False
 
-    if is_ipv4(ip_address):
-        octets = ip_address.split('.')
-        if all(0 <= int(octet) <= 255 for octet in octets):
-            return True
-
-    elif is_ipv6(ip_address):
+    if without_filter:
         return True
 
-    return False
+    return not is_unwanted_ip_int(ip_address_int)
 
 
 def reverse_ip(ip_address: str) -> str:
     """
-    Reverse the IP address for DNS lookup.
+    Reverse the octets of an IPv4 address for DNS lookup.
 
     Args:
-        ip_address (str): The IP address to reverse.
+        ip_address (str): The IPv4 address to reverse.
 
     Returns:
-        str: The reversed IP address.
+        str: The reversed IPv4 address.
     """
 
-    symbol = ':' if ':' in ip_address else '.'
-    return symbol.join(reversed(ip_address.split(symbol)))
+    octets = ip_address.split('.')
+    octets.reverse()
+
+    return '.'.join(octets)
 
 
 MALICIOUS_ASNS: Final[str] = [
@@ -305,6 +495,10 @@ MALICIOUS_ASNS: Final[str] = [
     "Bing", "Censys", "Hetzner", "Linode", "Amazon", "AWS", "DigitalOcean", "Vultr",
     "Azure", "Alibaba", "Netlify", "IBM", "Oracle", "Scaleway", "Cloud", "VPN"
 ]
+CASEFOLDED_MALICIOUS_ASNS: Final[Tuple[str, ...]] = tuple(
+    malicious_asn.casefold() for malicious_asn in MALICIOUS_ASNS
+)
+MALICIOUS_ASN_TOKENS: Final[frozenset] = frozenset(CASEFOLDED_MALICIOUS_ASNS)
 
 
 def is_asn_malicious(asn: str) -> bool:
@@ -318,16 +512,20 @@ def is_asn_malicious(asn: str) -> bool:
         bool: True if the ASN is not malicious, False if it is malicious.
     """
 
-    normalized_asn = asn.lower().strip()
+    normalized_asn = asn.casefold().strip()
+
+    if not MALICIOUS_ASN_TOKENS.isdisjoint(
+        token.strip(",.") for token in normalized_asn.split()):
+
+        return True
 
-    for malicious_asn in MALICIOUS_ASNS:
-        if malicious_asn.lower() in normalized_asn:
+    for malicious_asn in CASEFOLDED_MALICIOUS_ASNS:
+        if malicious_asn in normalized_asn:
             return True
 
     return False
 
 
-@cache_with_ttl(28800)
 def is_ip_malicious_ipinfo(ip_address: str, api_key: Optional[str] = None) -> Optional[bool]:
     """
     Checks if a given IP address is malicious using the IPinfo.io API.
@@ -380,7 +578,6 @@ def is_ip_malicious_ipinfo(ip_address: str, api_key: Optional[str] = None) -> Op
 
 
 
-@cache_with_ttl(28800)
 def is_ip_malicious_ipapi(ip_address: str, api_key: Optional[str] = None) -> Optional[bool]:
     """
     Uses the IPApi.com API to check the reputation of the given IP address.
@@ -418,7 +615,9 @@ def is_ip_malicious_ipapi(ip_address: str, api_key: Optional[str] = None) -> Opt
     return False
 
 
-@cache_with_ttl(28800)
+IPINTEL_CONTACT_EMAIL: Final[str] = secrets.token_hex(4) + "@outlook.com"
+
+
 def is_ip_malicious_ipintel(ip_address: str, _: Optional[str] = None) -> Optional[bool]:
     """
     Uses the getipintel.net API to check the reputation of the given IP address.
@@ -430,25 +629,22 @@ def is_ip_malicious_ipintel(ip_address: str, _: Optional[str] = None) -> Optiona
         Optional[bool]: True if the IP address is malicious, False otherwise.
     """
 
-    random_email = ''.join(
-        random.choice("abcdefghijklmnopqrstuvwxyz"
-                      "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789")
-                      for _ in range(random.randint(4, 9))) + '@outlook.com'
+    url = f"https://check.getipintel.net/check.php?ip={ip_address}&contact={IPINTEL_CONTACT_EMAIL}"
 
-    url = f"https://check.getipintel.net/check.php?ip={ip_address}&contact={random_email}"
+    data = http_request(url, default = b"").decode("ascii", "replace")
+    if not is_float(data):
+        return None
 
-    data = http_request(url, default = "")
-    if not data.isdigit():
+    score = float(data)
+    if score < 0:
         return None
 
-    score = int(data)
     if score > 0.90:
         return True
 
     return False
 
 
-@cache_with_ttl(28800)
 def is_ip_malicious_geoip(ip_address: str) -> bool:
     """
     Checks the reputation of the given IP address using GeoIP databases.
@@ -485,6 +681,39 @@ def is_ip_malicious_geoip(ip_address: str) -> bool:
     return False
 
 
+REPUTATION_CACHE: Final[TTLCache] = TTLCache(100000, 28800)
+
+
+def cached_reputation_lookup(service: str, ip_address: str,
+                             lookup_function: Callable, *args) -> Optional[bool]:
+    """
+    Looks up the reputation of an IP address with a service, sharing one bounded
+    cache keyed by (service, IP address) between all services.
+
+    Args:
+        service (str): The name of the service, used as part of the cache key.
+        ip_address (str): The IP address to check.
+        lookup_function (Callable): The function performing the uncached lookup.
+        *args: Additional arguments passed to the lookup function.
+
+    Returns:
+        Optional[bool]: The result of the lookup function. None results mean the
+            lookup failed and are not cached.
+    """
+
+    key = (service, ip_address)
+
+    result = REPUTATION_CACHE.get(key, CACHE_MISS)
+    if result is not CACHE_MISS:
+        return result
+
+    result = lookup_function(ip_address, *args)
+    if result is not None:
+        REPUTATION_CACHE.set(key, result)
+
+    return result
+
+
 def is_ip_malicious(ip_address: str, third_parties: Optional[list] = None,
                     logger: Optional[Logger] = None) -> bool:
     """
@@ -526,7 +755,9 @@ def is_ip_malicious(ip_address: str, third_parties: Optional[list] = None,
             if len(found_api_key) > 1:
                 api_key = found_api_key
 
-        is_malicious = third_party_function(ip_address, api_key)
+        is_malicious = cached_reputation_lookup(
+            third_party, ip_address, third_party_function, api_key
+        )
         if is_malicious is True:
             if logger is not None:
                 logger.log(ip_address = ip_address, malicious = True, service = third_party)
@@ -534,7 +765,7 @@ def is_ip_malicious(ip_address: str, third_parties: Optional[list] = None,
             return True
 
     if "geoip" in third_parties:
-        if is_ip_malicious_geoip(ip_address):
+        if cached_reputation_lookup("geoip", ip_address, is_ip_malicious_geoip):
             if logger is not None:
                 logger.log(ip_address = ip_address, malicious = True, service = "geoip")
 
@@ -543,10 +774,61 @@ def is_ip_malicious(ip_address: str, third_parties: Optional[list] = None,
     return False
 
 
+DNS_TIMEOUT: Final[float] = 1.0
+DNS_RESOLVER_POOL: Final[ThreadPoolExecutor] = ThreadPoolExecutor(
+    max_workers = 8, thread_name_prefix = "botblocker-dns"
+)
+# getaddrinfo errors that are a definite "no such name" answer (NXDOMAIN)
+DNS_NO_ANSWER_ERRORS: Final[frozenset] = frozenset(
+    getattr(socket, name) for name in ("EAI_NONAME", "EAI_NODATA") if hasattr(socket, name)
+)
+
+
+def resolve_hostname(hostname: str, timeout: float = DNS_TIMEOUT) -> Optional[str]:
+    """
+    Resolves a hostname to an IPv4 address without blocking the caller for
+    longer than the given timeout.
+
+    Args:
+        hostname (str): The hostname to resolve.
+        timeout (float): The maximum time in seconds to wait for an answer.
+
+    Returns:
+        Optional[str]: The first resolved IPv4 address, or None if the hostname
+            does not exist.
+
+    Raises:
+        TimeoutError: If the lookup did not finish within the timeout.
+        OSError: If the resolver failed without a definite answer.
+    """
+
+    future = DNS_RESOLVER_POOL.submit(socket.getaddrinfo, hostname, None, socket.AF_INET)
+
+    try:
+        address_info = future.result(timeout = timeout)
+    except FutureTimeoutError as exc:
+        future.cancel()
+        raise TimeoutError(f"Resolving {hostname} timed out") from exc
+    except socket.gaierror as exc:
+        if exc.errno in DNS_NO_ANSWER_ERRORS:
+            return None
+
+        raise
+
+    if not address_info:
+        return None
+
+    return address_info[0][4][0]
+
+
+TOR_DNSEL_ZONE: Final[str] = ".dnsel.torproject.org"
+
+
 @cache_with_ttl(28800)
-def is_ipv4_tor(ipv4_address: Optional[str] = None) -> bool:
+def query_tor_dnsel(ipv4_address: str) -> bool:
     """
-    Checks whether the given IPv4 address is Tor.
+    Asks the Tor DNS exit list whether the given IPv4 address is a Tor exit.
+    Lookups that fail raise instead of returning, so they are not cached.
 
     Args:
         ipv4_address (str): The IPv4 address to check.
@@ -555,18 +837,31 @@ def is_ipv4_tor(ipv4_address: Optional[str] = None) -> bool:
         bool: True if the IPv4 address is Tor, False otherwise.
     """
 
-    query = reverse_ip(ipv4_address)
+    query = reverse_ip(ipv4_address) + TOR_DNSEL_ZONE
 
-    try:
-        resolved_ip = socket.gethostbyname(query)
+    return resolve_hostname(query) == '127.0.0.2'
 
-        if resolved_ip == '127.0.0.2':
-            return True
 
-    except socket.gaierror as exc:
-        handle_exception(exc)
+def is_ipv4_tor(ipv4_address: Optional[str] = None) -> Optional[bool]:
+    """
+    Checks whether the given IPv4 address is Tor.
 
-    return False
+    Args:
+        ipv4_address (str): The IPv4 address to check.
+
+    Returns:
+        Optional[bool]: True if the IPv4 address is Tor, False if it is not
+            and None if the lookup timed out or failed.
+    """
+
+    try:
+        return query_tor_dnsel(ipv4_address)
+    except OSError:
+        return None
+
+
+EXONERATOR_REQUEST_HEADERS: Final[Dict[str, str]] = {**REQUEST_HEADERS, "Range": "bytes=0-"}
+EXONERATOR_POSITIVE_MARKER: Final[bytes] = b"Result is positive"
 
 
 @cache_with_ttl(28800)
@@ -591,22 +886,17 @@ def is_ip_tor_exonerator(ip_address: Optional[str] = None) -> bool:
     }
     url = f"{base_url}?{urlencode(query_params)}"
 
-    req = urllib.request.Request(
-        url, headers = {'Range': 'bytes=0-', "User-Agent":
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            " (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.3"
-        }
-    )
+    req = urllib.request.Request(url, headers = EXONERATOR_REQUEST_HEADERS)
     try:
         with urllib.request.urlopen(req, timeout = 3) as response:
-            html = ''
+            window = b''
             while True:
-                chunk = response.read(128).decode('utf-8')
+                chunk = response.read(4096)
                 if not chunk:
                     break
 
-                html += chunk
-                if "Result is positive" in html:
+                window = window[-len(EXONERATOR_POSITIVE_MARKER):] + chunk
+                if EXONERATOR_POSITIVE_MARKER in window:
                     return True
 
     except (urllib.error.HTTPError, urllib.error.URLError, TimeoutError) as exc:
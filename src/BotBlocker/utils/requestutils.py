@@ -9,10 +9,11 @@ Author:   tn3w (mail@tn3w.dev)
 License:  Apache-2.0 license
 """
 
-import re
-from typing import Optional, Final, Tuple, Any
-from urllib.parse import urlparse, urlunparse, urlencode, parse_qs, quote
-from flask import Request, g
+import os
+import functools
+from typing import Optional, Final, Tuple, List, Dict, Set, Any, Callable
+from urllib.parse import urlparse, urlunparse, urlencode, quote_plus, unquote_plus
+from flask import Request, g, has_request_context
 
 try:
     from useragentutils import is_user_agent_crawler
@@ -34,7 +35,120 @@ USER_AGENT_PATTERN: Final[str] = (
     r" \([^)]+\)"
     r" .+?/[\d\.]+.*"
 )
-USER_AGENT_REGEX: Final[re.Pattern] = re.compile(USER_AGENT_PATTERN)
+ASCII_DIGITS: Final[str] = "0123456789"
+VERSION_CHARACTERS: Final[frozenset] = frozenset(ASCII_DIGITS + ".")
+MIN_USER_AGENT_LENGTH: Final[int] = len("Mozilla/0.0 (x) x/0")
+VALID_SCHEMES: Final[frozenset] = frozenset(("http", "https"))
+
+# Set BOTBLOCKER_TRUST_PROXY_HEADERS=0 when the app is not behind a proxy; the
+# forwarded scheme and client IP headers are then ignored
+TRUST_PROXY_HEADERS: Final[bool] = os.environ.get(
+    "BOTBLOCKER_TRUST_PROXY_HEADERS", "1"
+).strip().lower() not in ("0", "false", "no", "off")
+
+
+def skip_ascii_digits(text: str, index: int) -> int:
+    """
+    Advances an index past a run of ASCII digits.
+
+    Args:
+        text (str): The string to scan.
+        index (int): The index to start at.
+
+    Returns:
+        int: The index of the first character that is not an ASCII digit.
+    """
+
+    text_length = len(text)
+    while index < text_length and text[index] in ASCII_DIGITS:
+        index += 1
+
+    return index
+
+
+def matches_user_agent_pattern(user_agent: str) -> bool:
+    """
+    Checks whether a user agent has the shape described by USER_AGENT_PATTERN,
+    e.g. "Mozilla/5.0 (X11; Linux x86_64) Firefox/128.0", using string
+    scans instead of the regex engine.
+
+    Args:
+        user_agent (str): The user agent string to check.
+
+    Returns:
+        bool: True if the user agent matches the pattern, False otherwise.
+    """
+
+    if len(user_agent) < MIN_USER_AGENT_LENGTH or not user_agent.startswith("Mozilla/"):
+        return False
+
+    major_version_end = skip_ascii_digits(user_agent, 8)
+    if major_version_end == 8 or user_agent[major_version_end:major_version_end + 1] != ".":
+        return False
+
+    minor_version_end = skip_ascii_digits(user_agent, major_version_end + 1)
+    if minor_version_end == major_version_end + 1\
+        or not user_agent.startswith(" (", minor_version_end):
+
+        return False
+
+    comment_end = user_agent.find(")", minor_version_end + 2)
+    if comment_end <= minor_version_end + 2 or not user_agent.startswith(" ", comment_end + 1):
+        return False
+
+    product_start = comment_end + 2
+    line_end = user_agent.find("\n", product_start)
+    if line_end == -1:
+        line_end = len(user_agent)
+
+    slash_index = user_agent.find("/", product_start + 1, line_end)
+    while slash_index != -1:
+        if user_agent[slash_index + 1:slash_index + 2] in VERSION_CHARACTERS:
+            return True
+
+        slash_index = user_agent.find("/", slash_index + 1, line_end)
+
+    return False
+
+
+def cache_for_request(func: Callable) -> Callable:
+    """
+    Caches the result of a function for the duration of the current request,
+    keyed by the function name and its positional arguments.
+
+    Args:
+        func (Callable): The function to decorate.
+
+    Returns:
+        Callable: The decorated function.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args: Any) -> Any:
+        """
+        Internal wrapper function.
+
+        Args:
+            *args: The positional arguments to pass to the function.
+        """
+
+        if not has_request_context():
+            return func(*args)
+
+        request_cache: Optional[Dict[Tuple[str, Tuple[Any, ...]], Any]] = getattr(
+            g, "botblocker_request_cache", None
+        )
+        if request_cache is None:
+            request_cache = {}
+            setattr(g, "botblocker_request_cache", request_cache)
+
+        key = (func.__name__, args)
+        if key not in request_cache:
+            request_cache[key] = func(*args)
+
+        return request_cache[key]
+
+    return wrapper
 
 
 def get_json_data(request: Request, default: Any = None) -> Any:
@@ -60,6 +174,35 @@ def get_json_data(request: Request, default: Any = None) -> Any:
     return json_data
 
 
+def requote_query(query: str, encoding: str = "utf-8") -> str:
+    """
+    Decodes and safely re-encodes every key and value of a query string
+    in a single pass.
+
+    Args:
+        query (str): The raw query string, without the leading "?".
+        encoding (str): The encoding used to turn percent-escapes into
+            characters and back.
+
+    Returns:
+        str: The re-encoded query string.
+    """
+
+    requoted_pairs: List[str] = []
+    for pair in query.split("&"):
+        if not pair:
+            continue
+
+        key, separator, value = pair.partition("=")
+        requoted_pairs.append(
+            quote_plus(unquote_plus(key, encoding), encoding = encoding) + separator
+            + quote_plus(unquote_plus(value, encoding), encoding = encoding)
+        )
+
+    return "&".join(requoted_pairs)
+
+
+@cache_for_request
 def get_url(request: Request) -> str:
     """
     Retrieve the full URL of the request.
@@ -67,85 +210,97 @@ def get_url(request: Request) -> str:
     :return: The full URL as a string.
     """
 
-    scheme = request.headers.get("X-Forwarded-Proto", "")
-    if scheme not in ["https", "http"]:
-        if request.is_secure:
-            scheme = "https"
-        else:
-            scheme = "http"
+    scheme = ""
+    if TRUST_PROXY_HEADERS:
+        scheme = request.headers.get("X-Forwarded-Proto", "").strip().lower()
 
-    parsed_url = urlparse(str(request.url))
+    if scheme not in VALID_SCHEMES:
+        scheme = "https" if request.is_secure else "http"
 
-    query_params = parse_qs(parsed_url.query)
-    safe_query = urlencode({k: [quote(v) for v in vs] for k, vs in query_params.items()})
+    base_url = request.base_url
+    url = scheme + base_url[base_url.index(":"):]
 
-    safe_url = urlunparse(
-        (scheme, request.host, parsed_url.path,
-         parsed_url.params, safe_query, parsed_url.fragment)
-    )
+    # Browsers never send the fragment, so the query string is all that is left
+    query_string = request.query_string
+    if not query_string:
+        return url
 
-    return safe_url
+    # latin-1 maps every byte to one character, so raw bytes round-trip unchanged
+    query = requote_query(query_string.decode("latin-1"), "latin-1")
+    if not query:
+        return url
 
+    return url + "?" + query
 
-def get_domain(url: str) -> str:
+
+def split_host(url: str) -> Tuple[str, List[str], bool]:
     """
-    Extracts the domain from a given HTTP request.
+    Parses the host of a URL once.
 
     Args:
-        url (str): The URL from which to extract the domain.
+        url (str): The URL to parse, with or without a scheme.
 
     Returns:
-        str: The extracted domain name from the request URL.
+        Tuple[str, List[str], bool]: The hostname without port, its dot-separated
+            parts and whether the hostname is an IP address.
     """
 
     if not url.startswith(("http://", "https://")):
         url = "http://" + url
 
-    parsed_url = urlparse(url)
-    netloc = parsed_url.netloc
+    hostname = urlparse(url).hostname or ""
+    is_ip = is_ipv4(hostname) or is_ipv6(hostname)
+
+    return hostname, hostname.split("."), is_ip
 
-    if ":" in netloc:
-        netloc = netloc.split(":")[0]
 
-    domain_parts = netloc.split(".")
-    if all(part.isdigit() for part in netloc.split(".")):
-        return netloc
+@cache_for_request
+def get_domain_and_subdomain(url: str) -> Tuple[str, Optional[str]]:
+    """
+    Extracts both the domain and the subdomain from a URL with a single parse.
 
-    if len(domain_parts) > 2:
-        domain = ".".join(domain_parts[-2:])
-    else:
-        domain = netloc
+    Args:
+        url (str): The URL from which to extract the domain and subdomain.
 
-    return domain
+    Returns:
+        Tuple[str, Optional[str]]: The domain and the subdomain, or None as
+            subdomain if the URL has none or its host is an IP address.
+    """
 
+    hostname, host_parts, is_ip = split_host(url)
 
-def get_subdomain(url: str) -> Optional[str]:
+    if is_ip or len(host_parts) <= 2:
+        return hostname, None
+
+    return ".".join(host_parts[-2:]), ".".join(host_parts[:-2])
+
+
+def get_domain(url: str) -> str:
     """
-    Extracts the subdomain from a given URL.
+    Extracts the domain from a given HTTP request.
 
     Args:
-        url (str): The URL from which to extract the subdomain.
+        url (str): The URL from which to extract the domain.
 
     Returns:
-        str: The extracted subdomain, or an empty string if no subdomain exists.
+        str: The extracted domain name from the request URL.
     """
 
-    parsed_url = urlparse(url)
-    netloc = parsed_url.netloc
+    return get_domain_and_subdomain(url)[0]
 
-    if is_ipv4(parsed_url.hostname) or is_ipv6(parsed_url.hostname):
-        return None
 
-    if ":" in netloc:
-        netloc = netloc.split(":")[0]
+def get_subdomain(url: str) -> Optional[str]:
+    """
+    Extracts the subdomain from a given URL.
 
-    domain_parts = netloc.split(".")
+    Args:
+        url (str): The URL from which to extract the subdomain.
 
-    if len(domain_parts) > 2:
-        subdomain = ".".join(domain_parts[:-2])
-        return subdomain
+    Returns:
+        str: The extracted subdomain, or an empty string if no subdomain exists.
+    """
 
-    return None
+    return get_domain_and_subdomain(url)[1]
 
 
 def update_url(original_url: str, new_host: Optional[str] = None,
@@ -170,21 +325,31 @@ def update_url(original_url: str, new_host: Optional[str] = None,
     parsed_url = urlparse(original_url)
     new_netloc = new_host if new_host else parsed_url.netloc
 
-    query_params = parse_qs(parsed_url.query)
+    skipped_params = set(params_to_remove) if params_to_remove else set()
+    if param_to_add:
+        skipped_params.update(param_to_add)
 
-    for key in query_params:
-        query_params[key] = [v.strip("[]'\"") for v in query_params[key]]
+    query_pairs: List[str] = []
+    for pair in parsed_url.query.split("&"):
+        key, _, value = pair.partition("=")
+        if not value:
+            continue
 
+        key = unquote_plus(key)
+        if key in skipped_params:
+            continue
 
-    if params_to_remove:
-        for param in params_to_remove:
-            query_params.pop(param, None)
+        query_pairs.append(
+            quote_plus(key) + "=" + quote_plus(unquote_plus(value).strip("[]'\""))
+        )
 
     if param_to_add:
-        for key, value in param_to_add.items():
-            query_params[key] = value
+        # Empty sequences encode to nothing and must not leave a stray "&"
+        added_query = urlencode(param_to_add, doseq=True)
+        if added_query:
+            query_pairs.append(added_query)
 
-    new_query = urlencode(query_params, doseq=True)
+    new_query = "&".join(query_pairs)
 
     new_url = urlunparse((
         parsed_url.scheme,
@@ -198,6 +363,10 @@ def update_url(original_url: str, new_host: Optional[str] = None,
     return new_url
 
 
+THEMES: Final[frozenset] = frozenset(("light", "dark"))
+THEME_SOURCES: Final[Tuple[str, ...]] = ("args", "cookies", "form")
+
+
 def get_theme(request: Request, without_customization: bool = False,
               default: str = "light") -> Tuple[Optional[str], bool]:
     """
@@ -215,30 +384,17 @@ def get_theme(request: Request, without_customization: bool = False,
             boolean indicating if the default theme is used.
     """
 
-    theme = None
     if not without_customization:
-        theme_from_args = request.args.get("theme")
-        theme_from_cookies = request.cookies.get("theme")
-        theme_from_form = request.form.get("theme")
-
-        theme = (
-            theme_from_args
-            if theme_from_args in ["light", "dark"]
-            else (
-                theme_from_cookies
-                if theme_from_cookies in ["light", "dark"]
-                else (
-                    theme_from_form
-                    if theme_from_form in ["light", "dark"]
-                    else None
-                )
-            )
-        )
+        # request.form parses the request body, so it is only read last
+        for source in THEME_SOURCES:
+            theme = getattr(request, source).get("theme")
+            if theme in THEMES:
+                return theme, False
+
+    return default, True
 
-    if theme is None:
-        return default, True
 
-    return theme, False
+GET_OR_POST_METHODS: Final[frozenset] = frozenset(("GET", "POST"))
 
 
 def is_post(request: Request) -> bool:
@@ -257,7 +413,7 @@ def is_post(request: Request) -> bool:
         bool: True if the request method is "POST", False otherwise.
     """
 
-    return request.method.lower() == "post"
+    return request.method == "POST"
 
 
 def is_get(request: Request) -> bool:
@@ -276,7 +432,7 @@ def is_get(request: Request) -> bool:
         bool: True if the request method is "GET", False otherwise.
     """
 
-    return request.method.lower() == "get"
+    return request.method == "GET"
 
 
 def is_get_or_post(request: Request) -> bool:
@@ -295,7 +451,7 @@ def is_get_or_post(request: Request) -> bool:
         bool: True if the request method is "GET" or "POST", False otherwise.
     """
 
-    return request.method.lower() in ("get", "post")
+    return request.method in GET_OR_POST_METHODS
 
 
 def get_http_version(request: Request) -> Optional[float]:
@@ -313,28 +469,29 @@ def get_http_version(request: Request) -> Optional[float]:
 
     server_protocol = request.environ.get("SERVER_PROTOCOL")
 
-    if not server_protocol:
+    if not server_protocol or "/" not in server_protocol:
         return None
 
-    match = re.search(r"HTTP/(\d\.\d|\d)", server_protocol)
-
-    if not match:
+    _, _, version = server_protocol.partition("/")
+    if not is_float(version):
         return None
 
-    first_match_group = match.group(1)
-    if not is_float(first_match_group):
-        return None
-
-    return float(first_match_group)
+    return float(version)
 
 
-IP_SOURCS: Final[list[tuple]] = [
+IP_SOURCS: Final[List[str]] = [
     "X-Real-Ip", "CF-Connecting-IP",
     "X-Forwarded-For", "X-Real-IP",
     "X-Cluster-Client-Ip", "X-Forwarded",
     "True-Client-Ip", "X-Appengine-User-Ip",
     "REMOTE_ADDR",
 ]
+IP_LOOKUPS: Final[Tuple[Tuple[str, str, str], ...]] = tuple(
+    (header_name, header_name.upper().replace("-", "_"),
+     "HTTP_" + header_name.upper().replace("-", "_"))
+    for source in IP_SOURCS if source != "REMOTE_ADDR"
+    for header_name in (source, source + "-V6")
+)
 
 
 def get_ip_address(request: Request) -> Optional[str]:
@@ -345,40 +502,44 @@ def get_ip_address(request: Request) -> Optional[str]:
     :return: The IP address
     """
 
-    ip_list = set()
+    headers, environ = request.headers, request.environ
 
-    for source in IP_SOURCS:
-        if source == "REMOTE_ADDR":
-            ip = request.remote_addr
-            if ip:
-                ip_list.add(ip)
+    # Most requests carry a single candidate, so the set is only created
+    # once a second distinct one shows up
+    first_ip: Optional[str] = None
+    seen_ips: Optional[Set[str]] = None
 
-            continue
+    # Without a trusted proxy these headers are client controlled
+    ip_lookups = IP_LOOKUPS if TRUST_PROXY_HEADERS else ()
+
+    for header_name, environ_name, http_environ_name in ip_lookups:
+        for ip in (headers.get(header_name), environ.get(environ_name),
+                   environ.get(http_environ_name)):
+            if not ip:
+                continue
 
-        for i in range(2):
-            if i == 1:
-                source = source + "-V6"
+            ip = ip.partition(",")[0].strip()
 
-            for method in ["environ", "headers"]:
-                if method == "headers":
-                    ip = request.headers.get(source)
-                else:
-                    source = source.upper().replace("-", "_")
-                    for i in range(2):
-                        if i == 1:
-                            source = "HTTP_" + source
+            if first_ip is None:
+                first_ip = ip
+            elif seen_ips is None:
+                if ip == first_ip:
+                    continue
 
-                        ip = request.environ.get(source)
+                seen_ips = {first_ip, ip}
+            elif ip in seen_ips:
+                continue
+            else:
+                seen_ips.add(ip)
 
-                if ip:
-                    ip = ip.split(",")[0] if "," in ip else ip
-                    ip_list.add(ip.strip())
+            if is_valid_ip(ip):
+                return ip
 
-    for ip in ip_list:
-        if is_valid_ip(ip):
-            return ip
+    ip = request.remote_addr
+    if ip == first_ip or (seen_ips is not None and ip in seen_ips):
+        return None
 
-    return None
+    return ip if is_valid_ip(ip) else None
 
 
 def is_user_agent_malicious(request: Request, check_for_crawlers: bool = False,
@@ -397,13 +558,13 @@ def is_user_agent_malicious(request: Request, check_for_crawlers: bool = False,
 
     user_agent = request.user_agent.string
 
-    if not isinstance(user_agent, str) or user_agent.strip() == "":
+    if not isinstance(user_agent, str) or not user_agent or user_agent.isspace():
         if logger is not None:
             logger.log(user_agent = user_agent, malicious = True, service = "uanone")
 
         return True
 
-    if bool(USER_AGENT_REGEX.match(user_agent)) is False:
+    if not matches_user_agent_pattern(user_agent):
         if logger is not None:
             logger.log(user_agent = user_agent, malicious = True, service = "uainvalid")
 
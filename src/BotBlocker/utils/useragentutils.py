@@ -1,5 +1,6 @@
 import re
-from typing import Final
+import functools
+from typing import Final, Tuple
 
 CRAWLER_PATTERNS: Final[tuple] = (
     r" daum[ /]"
@@ -1584,6 +1585,39 @@ CRAWLER_PATTERNS: Final[tuple] = (
 )
 
 
+def compile_crawler_regex(patterns: Tuple[str, ...]) -> re.Pattern:
+    """
+    Combines the crawler patterns into a single alternation so that a user
+    agent is matched against all of them with one call into the regex engine.
+
+    Args:
+        patterns (Tuple[str, ...]): The crawler patterns to combine.
+
+    Returns:
+        re.Pattern: The compiled alternation. Patterns that are not valid
+            regular expressions are left out.
+    """
+
+    valid_patterns = []
+    for pattern in patterns:
+        try:
+            re.compile(pattern)
+        except re.error:
+            continue
+
+        valid_patterns.append("(?:" + pattern + ")")
+
+    return re.compile("|".join(valid_patterns))
+
+
+CRAWLER_REGEX: Final[re.Pattern] = compile_crawler_regex(CRAWLER_PATTERNS)
+CRAWLER_SUBSTRINGS: Final[Tuple[str, ...]] = tuple(
+    pattern.lower().strip() for pattern in CRAWLER_PATTERNS
+)
+
+
+# Real traffic repeats a few thousand distinct user agents
+@functools.lru_cache(maxsize = 4096)
 def is_user_agent_crawler(user_agent: str) -> bool:
     """
     Determine if the given user agent string belongs to a web crawler.
@@ -1595,10 +1629,12 @@ def is_user_agent_crawler(user_agent: str) -> bool:
         bool: True if the user agent is a crawler, False otherwise.
     """
 
-    for pattern in CRAWLER_PATTERNS:
-        if re.match(pattern, user_agent) or\
-            pattern.lower().strip() in user_agent.lower():
+    if CRAWLER_REGEX.match(user_agent):
+        return True
 
+    lowered_user_agent = user_agent.lower()
+    for substring in CRAWLER_SUBSTRINGS:
+        if substring in lowered_user_agent:
             return True
 
     return False
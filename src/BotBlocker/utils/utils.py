@@ -7,17 +7,18 @@ Author:   tn3w (mail@tn3w.dev)
 License:  Apache-2.0 license
 """
 
-import re
 import json
 import time
 import socket
 import secrets
 import functools
+import threading
 import http.client
 import urllib.error
 import urllib.request
+from collections import OrderedDict
 from traceback import format_exc
-from typing import Tuple, Final, Optional, Any
+from typing import Tuple, Final, Optional, Union, Any, Callable, Dict
 
 
 CHARACTER_CATEGORIES: Final[dict] = {
@@ -28,6 +29,27 @@ CHARACTER_CATEGORIES: Final[dict] = {
 }
 
 
+@functools.lru_cache(maxsize = 16)
+def resolve_characters(characters: str) -> str:
+    """
+    Resolves a character specification such as "a-zA-Z0-9" into its alphabet.
+
+    Args:
+        characters (str): The character categories to include.
+
+    Returns:
+        str: The characters of all included categories, or the specification
+            itself if it names no category.
+    """
+
+    full_characters = ""
+    for category, mapping in CHARACTER_CATEGORIES.items():
+        if category in characters:
+            full_characters += mapping
+
+    return full_characters or characters
+
+
 def generate_secure_random_string(length: int, characters: str = "a-zA-Z0-9%"):
     """
     Generate a random string of a specified length using a set of characters.
@@ -41,12 +63,23 @@ def generate_secure_random_string(length: int, characters: str = "a-zA-Z0-9%"):
             composed of the selected characters.
     """
 
-    full_characters = ""
-    for category, mapping in CHARACTER_CATEGORIES.items():
-        if category in characters:
-            full_characters += mapping
+    full_characters = resolve_characters(characters)
+
+    # Draw random bytes in bulk and reject those above the largest multiple
+    # of the alphabet size, so every character stays equally likely
+    alphabet_size = len(full_characters)
+    if alphabet_size > 256:
+        return "".join(secrets.choice(full_characters) for _ in range(length))
+
+    byte_limit = 256 - 256 % alphabet_size
+
+    random_characters = []
+    while len(random_characters) < length:
+        for byte in secrets.token_bytes(length - len(random_characters)):
+            if byte < byte_limit:
+                random_characters.append(full_characters[byte % alphabet_size])
 
-    return "".join(secrets.choice(characters) for _ in range(length))
+    return "".join(random_characters)
 
 
 def is_float(value: str) -> bool:
@@ -63,8 +96,13 @@ def is_float(value: str) -> bool:
     if not isinstance(value, str):
         return False
 
-    float_pattern = re.compile(r'^-?\d+(\.\d+)?$')
-    return bool(float_pattern.match(value))
+    # isdecimal accepts exactly the characters matched by \d
+    number = value[1:] if value.startswith("-") else value
+    integer_part, separator, fractional_part = number.partition(".")
+    if not integer_part.isdecimal():
+        return False
+
+    return not separator or fractional_part.isdecimal()
 
 
 def handle_exception(exception: Tuple[Exception, str], *args) -> None:
@@ -88,12 +126,86 @@ def handle_exception(exception: Tuple[Exception, str], *args) -> None:
     print(exception, traceback, *args)
 
 
-def cache_with_ttl(ttl: int) -> callable:
+class TTLCache:
+    """
+    A thread-safe cache with a maximum size whose entries expire after a TTL.
+    """
+
+
+    def __init__(self, maxsize: int, ttl: int) -> None:
+        """
+        Initializes the cache.
+
+        Args:
+            maxsize (int): The maximum number of entries; the least recently
+                used entry is evicted when the cache is full.
+            ttl (int): The time to live of an entry in seconds.
+        """
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+
+    def get(self, key: Any, default: Optional[Any] = None) -> Optional[Any]:
+        """
+        Retrieves the value stored under a key if it has not expired.
+
+        Args:
+            key (Any): The key to look up.
+            default (Optional[Any]): The value returned if the key is missing or expired.
+
+        Returns:
+            Optional[Any]: The cached value or the default value.
+        """
+
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return default
+
+            self.entries.move_to_end(key)
+            return value
+
+
+    def set(self, key: Any, value: Any) -> None:
+        """
+        Stores a value under a key, evicting the least recently used entry
+        if the cache is full.
+
+        Args:
+            key (Any): The key to store the value under.
+            value (Any): The value to store.
+        """
+
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last = False)
+
+
+# Separates keyword arguments in cache keys so they cannot collide with positional ones
+KWARGS_MARKER: Final[object] = object()
+# Stands in for a missing entry so cached None results are still hits
+CACHE_MISS: Final[object] = object()
+
+
+def cache_with_ttl(ttl: int, maxsize: int = 1024) -> callable:
     """
     Caches the result of a function with a given TTL.
 
     Args:
         ttl (int): The TTL in seconds.
+        maxsize (int): The maximum number of cached results; the least
+            recently used result is evicted when the cache is full.
 
     Returns:
         callable: The decorated function.
@@ -110,7 +222,7 @@ def cache_with_ttl(ttl: int) -> callable:
             callable: The decorated function.
         """
 
-        cache = {}
+        cache = TTLCache(maxsize, ttl)
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
@@ -122,18 +234,16 @@ def cache_with_ttl(ttl: int) -> callable:
                 **kwargs: The keyword arguments to pass to the function.
             """
 
-            key = (args, tuple(kwargs.items()))
-            current_time = time.time()
-
-            if key in cache:
-                result, timestamp = cache[key]
-                if current_time - timestamp < ttl:
-                    return result
+            if kwargs:
+                key = (args, KWARGS_MARKER, tuple(sorted(kwargs.items())))
+            else:
+                key = args
 
-                del cache[key]
+            result = cache.get(key, CACHE_MISS)
+            if result is CACHE_MISS:
+                result = func(*args, **kwargs)
+                cache.set(key, result)
 
-            result = func(*args, **kwargs)
-            cache[key] = (result, current_time)
             return result
 
         return wrapper
@@ -141,56 +251,101 @@ def cache_with_ttl(ttl: int) -> callable:
     return decorator
 
 
-def matches_asterisk_rule(obj: str, asterisk_rule: str) -> bool:
+@functools.lru_cache(maxsize = 1024)
+def compile_asterisk_rule(asterisk_rule: str) -> Callable[[str], bool]:
+    """
+    Compiles an asterisk rule into a matcher that only performs the checks
+    the rule needs, so a rule is parsed once however often it is used.
+
+    Args:
+        asterisk_rule (str): The asterisk rule to compile.
+
+    Returns:
+        Callable[[str], bool]: A function that returns True if a string
+            matches the rule, False otherwise.
+    """
+
+    asterisk_count = asterisk_rule.count('*')
+    if asterisk_count == 0:
+        return lambda obj: obj == asterisk_rule
+
+    if asterisk_count == 1:
+        if asterisk_rule == '*':
+            return lambda obj: True
+
+        if asterisk_rule[-1] == '*':
+            prefix = asterisk_rule[:-1]
+            return lambda obj: obj.startswith(prefix)
+
+        if asterisk_rule[0] == '*':
+            suffix = asterisk_rule[1:]
+            return lambda obj: obj.endswith(suffix)
+
+        start, _, end = asterisk_rule.partition('*')
+        minimum_length = len(start) + len(end)
+
+        return lambda obj: len(obj) >= minimum_length\
+            and obj.startswith(start) and obj.endswith(end)
+
+    first_asterisk_index = asterisk_rule.index('*')
+    last_asterisk_index = asterisk_rule.rindex('*')
+    start = asterisk_rule[:first_asterisk_index]
+    middle = asterisk_rule[first_asterisk_index + 1:last_asterisk_index]
+    end = asterisk_rule[last_asterisk_index + 1:]
+
+    start_length, end_length = len(start), len(end)
+    minimum_length = start_length + len(middle) + end_length
+
+    # The middle may only match between the prefix and the suffix
+    return lambda obj: len(obj) >= minimum_length\
+        and obj.startswith(start) and obj.endswith(end)\
+        and obj.find(middle, start_length, len(obj) - end_length) != -1
+
+
+def matches_asterisk_rule(obj: str, asterisk_rule: str, negate: bool = False) -> bool:
     """
     Checks if a string matches a given asterisk rule.
 
     Args:
         obj (str): The string to check.
         asterisk_rule (str): The asterisk rule to match against.
+        negate (bool): If True, checks that the string does not match the rule.
 
     Returns:
         bool: True if the string matches the rule, False otherwise.
     """
 
-    if isinstance(obj, str) and isinstance(asterisk_rule, str) and '*' in asterisk_rule:
-        parts = asterisk_rule.split('*')
-
-        if len(parts) == 2:
-            start, end = parts
-            return obj.startswith(start) and obj.endswith(end)
-
-        first_asterisk_index = asterisk_rule.index('*')
-        last_asterisk_index = asterisk_rule.rindex('*')
-        start = asterisk_rule[:first_asterisk_index]
-        middle = asterisk_rule[first_asterisk_index + 1:last_asterisk_index]
-        end = asterisk_rule[last_asterisk_index + 1:]
+    if not isinstance(obj, str) or not isinstance(asterisk_rule, str):
+        return (obj == asterisk_rule) != negate
 
-        return obj.startswith(start) and obj.endswith(end) and middle in obj
+    return compile_asterisk_rule(asterisk_rule)(obj) != negate
 
-    return obj == asterisk_rule
 
-
-def get_fields(rule: tuple) -> list:
+def get_fields(rule: Union[tuple, "Rule"]) -> list:
     """
     Extracts fields from a rule tuple.
 
     Args:
-        rule (tuple): The rule tuple to extract fields from.
+        rule (Union[tuple, Rule]): The rule tuple or compiled rule to extract
+            fields from.
 
     Returns:
-        list: A list of fields extracted from the rule.
+        list: A flat list of the fields used by the rule, in rule order.
     """
 
     fields = []
 
-    for i, value in enumerate(rule):
-        if value in ('and', 'or'):
-            fields.append(get_fields(rule[:i]))
-            fields.append(get_fields(rule[i + 1:]))
+    nodes = [rule if isinstance(rule, Rule) else compile_rule(rule)]
+    while nodes:
+        node = nodes.pop()
+        if node.combinator == RULE_LEAF:
+            fields.append(node.field)
+            continue
+
+        left, right = node.children
+        nodes.append(right)
+        nodes.append(left)
 
-    field = rule[0]
-    fields.append(field)
     return fields
 
 
@@ -209,8 +364,10 @@ def compare_numbers(field_data: Any, value: Any, morethan: bool = False) -> bool
     """
 
     if isinstance(field_data, str):
-        if field_data.is_digit():
+        try:
             field_data = int(field_data)
+        except ValueError:
+            return False
 
     if not isinstance(field_data, int):
         return False
@@ -246,6 +403,70 @@ def check_string_start_end(field_data: Any, value: str, startswith: bool = False
     return field_data.endswith(value)
 
 
+def contains_value(field_data: Any, value: Any, negate: bool = False) -> bool:
+    """
+    Checks if the field data contains a value.
+
+    Args:
+        field_data (Any): The container to search in.
+        value (Any): The value to search for.
+        negate (bool): If True, checks that the value is not contained.
+
+    Returns:
+        bool: True if the condition is met, False otherwise.
+    """
+
+    return (value in field_data) != negate
+
+
+def is_value_in(field_data: Any, value: Any, negate: bool = False) -> bool:
+    """
+    Checks if the field data is contained in a value.
+
+    Args:
+        field_data (Any): The data to search for.
+        value (Any): The container to search in.
+        negate (bool): If True, checks that the field data is not contained.
+
+    Returns:
+        bool: True if the condition is met, False otherwise.
+    """
+
+    return (field_data in value) != negate
+
+
+OperatorHandler = Callable[[Any, Any, bool], bool]
+
+# Every handler takes (field_data, value, flag); the flag selects negation,
+# the comparison direction or the string end depending on the handler
+OPERATOR_ALIASES: Final[Tuple[Tuple[Tuple[str, ...], OperatorHandler, bool], ...]] = (
+    (('==', 'equals', 'equal', 'is', 'isthesameas'), matches_asterisk_rule, False),
+    (
+        ('!=', 'doesnotequal', 'doesnotequals', 'notequals', 'notequal', 'notis'),
+        matches_asterisk_rule, True
+    ),
+    (('contains', 'contain'), contains_value, False),
+    (
+        ('doesnotcontain', 'doesnotcontains', 'notcontain', 'notcontains'),
+        contains_value, True
+    ),
+    (('isin', 'in'), is_value_in, False),
+    (('isnotin', 'notisin', 'notin'), is_value_in, True),
+    (('greaterthan', 'largerthan'), compare_numbers, True),
+    (('lessthan',), compare_numbers, False),
+    (('startswith', 'beginswith'), check_string_start_end, True),
+    (('endswith', 'concludeswith', 'finisheswith'), check_string_start_end, False),
+)
+OPERATORS: Final[Dict[str, Tuple[OperatorHandler, bool]]] = {
+    operator: (handler, flag)
+    for operators, handler, flag in OPERATOR_ALIASES
+    for operator in operators
+}
+UNKNOWN_OPERATOR: Final[Tuple[OperatorHandler, bool]] = (
+    lambda field_data, value, flag: False, False
+)
+
+
 def evaluate_operator(field_data: Any, operator: str, value: Any) -> bool:
     """
     Evaluates an operator against field data and a value.
@@ -259,75 +480,154 @@ def evaluate_operator(field_data: Any, operator: str, value: Any) -> bool:
         bool: True if the evaluation is true, False otherwise.
     """
 
-    operator_actions = [
-        (
-            ['==', 'equals', 'equal', 'is', 'isthesameas'],
-            lambda: matches_asterisk_rule(field_data, value)
-        ),
-        (
-            ['!=', 'doesnotequal', 'doesnotequals', 'notequals', 'notequal', 'notis'],
-            lambda: not matches_asterisk_rule(field_data, value)
-        ),
-        (['contains', 'contain'], lambda: value in field_data),
-        (
-            ['doesnotcontain', 'doesnotcontains', 'notcontain', 'notcontains'],
-            lambda: value not in field_data
-        ),
-        (['isin', 'in'], lambda: field_data in value),
-        (['isnotin', 'notisin', 'notin'], lambda: field_data not in value),
-        (['greaterthan', 'largerthan'], lambda: compare_numbers(field_data, value, True)),
-        (['lessthan'], lambda: compare_numbers(field_data, value)),
-        (
-            ['startswith', 'beginswith'],
-            lambda: check_string_start_end(field_data, value, True)
-        ),
-        (
-            ['endswith', 'concludeswith', 'finisheswith'],
-            lambda: check_string_start_end(field_data, value)
-        ),
-    ]
-
-    for operators, action in operator_actions:
-        if operator in operators:
-            return action()
-
-    return False
-
-
-def matches_rule(rule: tuple, fields: dict) -> bool:
+    handler, flag = OPERATORS.get(operator, UNKNOWN_OPERATOR)
+    return handler(field_data, value, flag)
+
+
+def normalize_rule(rule: tuple) -> tuple:
     """
-    Checks if a rule matches the given fields.
+    Strips and lowercases every operator of a rule so that matching does not
+    have to normalize them on each evaluation.
 
     Args:
-        rule (tuple): The rule to check.
-        fields (dict): The fields to match against.
+        rule (tuple): The rule to normalize.
 
     Returns:
-        bool: True if the rule matches the fields, False otherwise.
+        tuple: The rule with normalized operators.
     """
 
-    i = 0
     for i, value in enumerate(rule):
-        if value == 'and':
-            return matches_rule(rule[:i], fields) and \
-                matches_rule(rule[i + 1:], fields)
+        if value in ('and', 'or'):
+            return normalize_rule(rule[:i]) + (value,) + normalize_rule(rule[i + 1:])
+
+    if len(rule) != 3:
+        return rule
+
+    field, operator, value = rule
+    if isinstance(operator, str):
+        operator = operator.strip(' ').lower()
+
+    return (field, operator, value)
+
+
+RULE_LEAF: Final[int] = 0
+RULE_AND: Final[int] = 1
+RULE_OR: Final[int] = 2
+
+
+class Rule:
+    """
+    A rule parsed once from its flat tuple form. Leaves hold the field and
+    the resolved operator handler, "and" and "or" nodes hold two children.
+    """
+
+    __slots__ = ("combinator", "field", "handler", "flag", "value", "children")
+
+
+    def __init__(self, combinator: int, field: Any = None,
+                 handler: Optional[Callable[[Any, Any, bool], bool]] = None,
+                 flag: bool = False, value: Any = None,
+                 children: Tuple["Rule", ...] = ()) -> None:
+        """
+        Initializes the rule node.
+
+        Args:
+            combinator (int): RULE_LEAF, RULE_AND or RULE_OR.
+            field (Any): The field a leaf checks.
+            handler (Optional[Callable[[Any, Any, bool], bool]]): The operator
+                handler of a leaf.
+            flag (bool): The flag passed to the handler.
+            value (Any): The value a leaf compares against.
+            children (Tuple[Rule, ...]): The left and right rule of a combinator.
+        """
+
+        self.combinator = combinator
+        self.field = field
+        self.handler = handler
+        self.flag = flag
+        self.value = value
+        self.children = children
+
+
+    def matches(self, fields: dict) -> bool:
+        """
+        Checks if the rule matches the given fields.
+
+        Args:
+            fields (dict): The fields to match against.
+
+        Returns:
+            bool: True if the rule matches the fields, False otherwise.
+        """
+
+        combinator = self.combinator
+        if combinator == RULE_AND:
+            left, right = self.children
+            return left.matches(fields) and right.matches(fields)
 
-        if value == 'or':
-            return matches_rule(rule[:i], fields) or \
-                matches_rule(rule[i + 1:], fields)
+        if combinator == RULE_OR:
+            left, right = self.children
+            return left.matches(fields) or right.matches(fields)
+
+        field_data = fields.get(self.field, None)
+        if field_data is None:
+            return False
+
+        return self.handler(field_data, self.value, self.flag)
+
+
+@functools.lru_cache(maxsize = 1024)
+def compile_rule(rule: tuple) -> Rule:
+    """
+    Parses a flat rule tuple once into a tree of Rule nodes, so that
+    evaluating it does not rescan or slice the rule.
+
+    Args:
+        rule (tuple): The rule to compile, e.g. ("path", "==", "/*", "and", ...).
+
+    Returns:
+        Rule: The root of the parsed rule.
+    """
 
-        i += 1
+    for i, value in enumerate(rule):
+        if value == 'and' or value == 'or':
+            return Rule(
+                RULE_AND if value == 'and' else RULE_OR,
+                children = (compile_rule(rule[:i]), compile_rule(rule[i + 1:]))
+            )
 
     field, operator, value = rule
-    field_data = fields.get(field, None)
+    handler, flag = OPERATORS.get(operator, UNKNOWN_OPERATOR)
 
-    if field_data is None:
-        return False
+    return Rule(RULE_LEAF, field, handler, flag, value)
 
-    if isinstance(operator, str):
-        operator = operator.strip(' ').lower()
 
-    return evaluate_operator(field_data, operator, value)
+def matches_rule(rule: Union[tuple, Rule], fields: dict) -> bool:
+    """
+    Checks if a rule matches the given fields.
+
+    Args:
+        rule (Union[tuple, Rule]): The rule to check, either normalized with
+            normalize_rule or already compiled with compile_rule.
+        fields (dict): The fields to match against.
+
+    Returns:
+        bool: True if the rule matches the fields, False otherwise.
+    """
+
+    if not isinstance(rule, Rule):
+        rule = compile_rule(rule)
+
+    return rule.matches(fields)
+
+
+HTTP_OPENER: Final[urllib.request.OpenerDirector] = urllib.request.build_opener()
+
+# Shared by every request; Request copies the headers, but never mutate this dict
+REQUEST_HEADERS: Final[Dict[str, str]] = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+                  " (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.3"
+}
 
 
 def http_request(url: str, method: str = "GET", timeout: int = 2,
@@ -356,27 +656,21 @@ def http_request(url: str, method: str = "GET", timeout: int = 2,
     """
 
     try:
-        req = urllib.request.Request(
-            url, headers = {"User-Agent":
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-                " (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.3"
-            }, method = method
-        )
-
-        with urllib.request.urlopen(req, timeout = timeout) as response:
+        req = urllib.request.Request(url, headers = REQUEST_HEADERS, method = method)
+
+        with HTTP_OPENER.open(req, timeout = timeout) as response:
             if response.getcode() != 200:
                 return default
 
-            content = response.read().decode("utf-8")
-
-        if is_json:
-            return json.loads(content)
+            if is_json:
+                return json.load(response)
 
-        return content
+            return response.read()
     except (urllib.error.HTTPError, urllib.error.URLError, socket.timeout, TimeoutError,
             json.JSONDecodeError, http.client.RemoteDisconnected, UnicodeEncodeError,
-            http.client.IncompleteRead, http.client.HTTPException, ConnectionResetError,
-            ConnectionAbortedError, ConnectionRefusedError, ConnectionError) as exc:
+            UnicodeDecodeError, http.client.IncompleteRead, http.client.HTTPException,
+            ConnectionResetError, ConnectionAbortedError, ConnectionRefusedError,
+            ConnectionError) as exc:
         handle_exception(exc)
 
     return default
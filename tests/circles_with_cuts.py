@@ -1,82 +1,123 @@
 import cv2
 import math
 import numpy as np
-import random
 import base64
-
-def generate_captcha_with_cut():
-    img_height, img_width = 500, 800
-    num_circles, circle_radius, dim_alpha = 20, 60, 0.5
-    cut_chance, bright_cut = 0.25, True
-    background_color = (24, 24, 24)
-    background = np.full((img_height, img_width, 3), background_color, dtype=np.uint8)
-    bright_points = random.randint(200, 400)
-    dim_points = random.randint(50, 100)
-
-    def create_separating_cut(img, center, radius):
-        cx, cy = center
-        cut_angle = random.uniform(0, 2 * np.pi)
-        preserve_points = generate_random_points(center, radius // 2, random.randint(10, 30))
-
-        for theta in np.linspace(cut_angle - np.pi / 3, cut_angle, 400):
-            for r in np.linspace(0, radius, 50):
-                x, y = int(cx + r * np.cos(theta)), int(cy + r * np.sin(theta))
-                if 0 <= x < img_width and 0 <= y < img_height:
-                    img[y, x] = background_color
-
-        for point in preserve_points:
-            random_color = tuple(random.randint(100, 150) for _ in range(3))
-            cv2.circle(img, point, 1, random_color, -1)
-
-    def generate_random_points(center, radius, num_points):
-        points = []
-        for _ in range(num_points):
-            r = radius * np.sqrt(random.random())
-            theta = random.uniform(0, 2 * np.pi)
-            x = int(center[0] + r * np.cos(theta))
-            y = int(center[1] + r * np.sin(theta))
-            points.append((x, y))
-        return points
-
-    def is_overlapping(center1, center2, radius):
-        return np.linalg.norm(np.array(center1) - np.array(center2)) < (1.5 * radius)
-
-    circle_positions, cut_circle_pos = [], None
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+rng: np.random.Generator = np.random.default_rng()
+webp_encode_params: List[int] = [int(cv2.IMWRITE_WEBP_QUALITY), 60]
+background_buffers = threading.local()
+
+# Pixels covered by a filled circle of radius 1
+dot_offsets = ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1))
+
+def draw_dots(img: np.ndarray, points: np.ndarray, colors: np.ndarray) -> None:
+    img_height, img_width = img.shape[:2]
+    for dx, dy in dot_offsets:
+        xs, ys = points[:, 0] + dx, points[:, 1] + dy
+        in_bounds = (xs >= 0) & (xs < img_width) & (ys >= 0) & (ys < img_height)
+        img[ys[in_bounds], xs[in_bounds]] = colors[in_bounds]
+
+def generate_random_points(centers: Union[Tuple[int, int], np.ndarray], radius: int, num_points: int) -> np.ndarray:
+    # centers is a single (x, y) or one center per point
+    r = np.float32(radius) * np.sqrt(rng.random(num_points, dtype=np.float32))
+    theta = np.float32(2 * np.pi) * rng.random(num_points, dtype=np.float32)
+    offsets = np.empty((num_points, 2), dtype=np.float32)
+    offsets[:, 0] = r * np.cos(theta)
+    offsets[:, 1] = r * np.sin(theta)
+    return (np.asarray(centers, dtype=np.float32) + offsets).astype(np.int32)
+
+def create_separating_cut(img: np.ndarray, center: Tuple[int, int], radius: int,
+                          background_color: Tuple[int, int, int]) -> None:
+    cut_angle: float = float(rng.uniform(0, 2 * np.pi))
+    preserve_points = generate_random_points(center, radius // 2, int(rng.integers(10, 31)))
+
+    start_angle, end_angle = math.degrees(cut_angle - math.pi / 3), math.degrees(cut_angle)
+    cv2.ellipse(img, center, (radius, radius), 0, start_angle, end_angle, background_color, -1)
+
+    preserve_colors = rng.integers(100, 151, size=(len(preserve_points), 3), dtype=np.uint8)
+    draw_dots(img, preserve_points, preserve_colors)
+
+def generate_captcha_with_cut() -> Dict[str, Any]:
+    img_height: int = 500
+    img_width: int = 800
+    num_circles: int = 20
+    circle_radius: int = 60
+    dim_alpha: float = 0.5
+    cut_chance: float = 0.25
+    bright_cut: bool = True
+    background_color: Tuple[int, int, int] = (24, 24, 24)
+    # Reuse this thread's frame buffer; it never escapes, only its encoding does
+    background = getattr(background_buffers, "image", None)
+    if background is None or background.shape != (img_height, img_width, 3):
+        background = background_buffers.image = np.empty((img_height, img_width, 3), dtype=np.uint8)
+    background[:] = background_color
+    bright_points: int = int(rng.integers(200, 401))
+    dim_points: int = int(rng.integers(50, 101))
+
+    min_distance_squared = (1.5 * circle_radius) ** 2
+
+    def is_overlapping(center1: Tuple[int, int], center2: Tuple[int, int]) -> bool:
+        dx, dy = center1[0] - center2[0], center1[1] - center2[1]
+        return dx * dx + dy * dy < min_distance_squared
+
+    # A cell's diagonal equals the minimum distance, so every cell holds at
+    # most one center and overlaps can only come from the 5x5 neighborhood
+    cell_size: float = 1.5 * circle_radius / math.sqrt(2)
+    grid_columns, grid_rows = int(img_width / cell_size) + 1, int(img_height / cell_size) + 1
+    grid: List[List[Optional[Tuple[int, int]]]] = [[None] * grid_columns for _ in range(grid_rows)]
+    max_placement_attempts = 1000
+
+    def is_position_free(x: int, y: int) -> bool:
+        column, row = int(x / cell_size), int(y / cell_size)
+        for neighbor_row in grid[max(row - 2, 0):row + 3]:
+            for position in neighbor_row[max(column - 2, 0):column + 3]:
+                if position is not None and is_overlapping((x, y), position):
+                    return False
+        return True
+
+    circles: List[Tuple[int, int, bool, bool]] = []
+    cut_circle_pos: Optional[Tuple[int, int]] = None
 
     for _ in range(num_circles):
-        while True:
-            x, y = random.randint(circle_radius, img_width - circle_radius), random.randint(circle_radius, img_height - circle_radius)
-            if not any(is_overlapping((x, y), pos, circle_radius) for pos in circle_positions):
-                circle_positions.append((x, y))
+        for _ in range(max_placement_attempts):
+            x = int(rng.integers(circle_radius, img_width - circle_radius + 1))
+            y = int(rng.integers(circle_radius, img_height - circle_radius + 1))
+            if is_position_free(x, y):
                 break
+        else:
+            break
 
-        is_bright = random.random() > 0.5
-        num_points = bright_points if is_bright else dim_points
-        circle_points = generate_random_points((x, y), circle_radius, num_points)
-
-        for point in circle_points:
-            random_color = tuple(random.randint(0, 255) for _ in range(3))
-            cv2.circle(background, point, 1, random_color, -1)
+        grid[int(y / cell_size)][int(x / cell_size)] = (x, y)
 
-        if not is_bright:
-            overlay = np.zeros_like(background, dtype=np.uint8)
-            for point in circle_points:
-                random_color = tuple(random.randint(0, 255) for _ in range(3))
-                cv2.circle(overlay, point, 1, random_color, -1)
-            background = cv2.addWeighted(background, 1, overlay, dim_alpha, 0)
+        is_bright: bool = rng.random() > 0.5
 
         has_cut = False
-        if not is_bright and random.random() < cut_chance:
+        if not is_bright and rng.random() < cut_chance:
             has_cut = True
         elif is_bright and bright_cut:
             has_cut = True
             bright_cut = False
 
+        circles.append((x, y, is_bright, has_cut))
+
+    # Draw the dots of all circles in one pass, then cut the chosen circles
+    centers = np.array([(x, y) for x, y, _, _ in circles], dtype=np.int32).reshape(-1, 2)
+    is_dim = np.array([not is_bright for _, _, is_bright, _ in circles], dtype=bool)
+    counts = np.where(is_dim, dim_points, bright_points)
+    points = generate_random_points(np.repeat(centers, counts, axis=0), circle_radius, int(counts.sum()))
+    # Dim dots get dim_alpha of their color added back on top, in the same write
+    scales = np.where(np.repeat(is_dim, counts), 1 + dim_alpha, 1.0)
+    colors = np.rint(rng.integers(0, 256, size=(len(points), 3)) * scales[:, None])
+    draw_dots(background, points, np.minimum(colors, 255).astype(np.uint8))
+
+    for x, y, _, has_cut in circles:
         if has_cut:
             cut_circle_pos = (x, y)
-            create_separating_cut(background, (x, y), circle_radius)
+            create_separating_cut(background, (x, y), circle_radius, background_color)
 
-    _, buffer = cv2.imencode('.webp', background, [int(cv2.IMWRITE_WEBP_QUALITY), 80])
+    _, buffer = cv2.imencode('.webp', background, webp_encode_params)
     img_base64 = base64.b64encode(buffer).decode('utf-8')
 
     return {
@@ -84,11 +125,12 @@ def generate_captcha_with_cut():
         "cut_circle_position": (cut_circle_pos[0], cut_circle_pos[1], circle_radius)
     }
 
-def is_point_in_circle(x, y, circle_center_x, circle_center_y, circle_radius):
-    distance = math.sqrt((x - circle_center_x) ** 2 + (y - circle_center_y) ** 2)
+def is_point_in_circle(x: int, y: int, circle_center_x: int, circle_center_y: int, circle_radius: int) -> bool:
+    dx, dy = x - circle_center_x, y - circle_center_y
 
-    return distance <= circle_radius
+    return dx * dx + dy * dy <= circle_radius * circle_radius
 
 
-result = generate_captcha_with_cut()
-print(result)
+if __name__ == "__main__":
+    result = generate_captcha_with_cut()
+    print(result)